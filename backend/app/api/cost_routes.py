@@ -58,14 +58,7 @@ async def get_llm_stats():
 @router.post("/reset-llm-stats")
 async def reset_llm_stats():
     """Reset LLM statistics (for testing)"""
-    optimized_llm_service.stats = {
-        "total_calls": 0,
-        "cache_hits": 0,
-        "rule_based": 0,
-        "fast_model_calls": 0,
-        "smart_model_calls": 0,
-        "total_tokens": 0
-    }
+    optimized_llm_service.reset_stats()
     optimized_llm_service.response_cache.clear()
     
     return {
@@ -219,7 +219,8 @@ async def scan_image(
             personal_docs=personal_docs,
             recycler_info=recycler_info,
             material=material,
-            weight_estimate=weight_estimate
+            weight_estimate=weight_estimate,
+            user_query=bool(query_en)
         )
         
         logger.info("LLM reasoning complete")
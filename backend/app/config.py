@@ -11,6 +11,11 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "renova"
+    MONGODB_MAX_POOL_SIZE: int = 200
+    MONGODB_MIN_POOL_SIZE: int = 20
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 3000
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 2000
+    MONGODB_COMPRESSORS: str = "zstd"  # Needs the zstandard package, else ignored
     
     # Milvus
     MILVUS_HOST: str = "localhost"
@@ -18,6 +23,9 @@ class Settings(BaseSettings):
     
     # Groq API (Free LLM)
     GROQ_API_KEY: str
+    LLM_ROUTER_WEIGHTS: str = "models/llm_router.npz"  # From scripts/train_router.py; keyword routing if missing
+    LLM_ROUTER_THRESHOLD: float = 0.5  # P(smart model needed) above which the smart model is used
+    LLM_CASCADE_THRESHOLD: float = 0.75  # Fast-model self-confidence needed to skip the smart model (>1 disables)
     
     # Bhashini API (Government of India Translation)
     BHASHINI_API_KEY: str = ""
@@ -34,7 +42,19 @@ class Settings(BaseSettings):
     
     # Model Paths
     CLIP_MODEL: str = "openai/clip-vit-base-patch32"
+    CLIP_BACKEND: str = "torch"  # torch, int8 (dynamic int8 Linear layers, CPU only), autoquant (torchao), openai-jit or onnx
+    CLIP_JIT_MODEL: str = "ViT-B/32"  # openai/CLIP name for the openai-jit backend
+    CLIP_ONNX_DIR: str = "models/clip-onnx"  # Exported ONNX towers for the onnx backend
+    CLIP_HALF_PRECISION: bool = True  # fp16 on GPU
+    CLIP_CPU_BF16: bool = False  # bf16 on CPU (only pays off with AVX512-BF16/AMX)
+    CLIP_COMPILE: bool = False  # torch.compile the vision tower (warmed up at startup)
+    CLIP_COMPILE_MODE: str = "reduce-overhead"  # reduce-overhead captures CUDA graphs; or max-autotune
+    CLIP_GPU_DECODE: bool = True  # Decode JPEGs with nvJPEG on CUDA hosts (PIL otherwise)
+    CLIP_MAX_BATCH: int = 16  # Images coalesced into one forward pass
+    CLIP_BATCH_WAIT_MS: float = 5.0  # How long the batcher waits for more images
     WHISPER_MODEL: str = "small"  # Using local small model for translation
+    WHISPER_BACKEND: str = "openai"  # openai or faster-whisper (CTranslate2 int8; its CUDA build must match torch's)
+    WHISPER_COMPILE: bool = False  # torch.compile the openai backend's encoder/decoder (CUDA, slow startup)
     
     # OSM APIs
     NOMINATIM_URL: str = "https://nominatim.openstreetmap.org"
@@ -51,6 +71,13 @@ class Settings(BaseSettings):
     FUSION_WEIGHT_USER: float = 0.2
     FUSION_WEIGHT_TIME: float = 0.1
     
+    # Fraud Weights
+    FRAUD_WEIGHT_DUPLICATE_IMAGE: float = 0.4
+    FRAUD_WEIGHT_INTERNET_IMAGE: float = 0.3
+    FRAUD_WEIGHT_GPS_MISMATCH: float = 0.2
+    FRAUD_WEIGHT_WEIGHT_SANITY: float = 0.1
+    FRAUD_THRESHOLD: float = 0.5
+    
     # Material Base Rates (credits per kg)
     # Higher rates so even small items (30g bottle = 0.03kg) get meaningful tokens
     MATERIAL_RATES: dict = {
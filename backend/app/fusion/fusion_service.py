@@ -175,7 +175,7 @@ class FusionService:
             v_time_t = to_tensor(v_time)
             
             # Fuse
-            with torch.no_grad():
+            with torch.inference_mode():
                 v_fused_t = self.model(
                     v_img=v_img_t,
                     v_text=v_text_t,
@@ -4,7 +4,10 @@ Main FastAPI application
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
+import os
 from datetime import datetime
 from typing import Optional, List
 from bson import ObjectId
@@ -27,6 +30,12 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting ReNova backend...")
     
+    # Image preprocessing and audio decoding run via asyncio.to_thread (model calls
+    # have their own threads); they are CPU-bound, so one worker per core
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="renova-worker")
+    )
+    
     # Connect to MongoDB
     await db.connect_db()
     
@@ -38,19 +47,24 @@ async def lifespan(app: FastAPI):
     from app.voice.whisper_service import voice_service
     from app.vision.clip_service import vision_service
     
-    logger.info("Initializing Whisper model for voice transcription...")
-    try:
-        await voice_service.initialize()
+    # Load both models concurrently (each loads on a worker thread) so the
+    # first scan/voice request doesn't pay the cold start
+    logger.info("Initializing Whisper (voice) and CLIP (vision) models...")
+    voice_result, vision_result = await asyncio.gather(
+        voice_service.initialize(),
+        vision_service.initialize(),
+        return_exceptions=True
+    )
+    
+    if isinstance(voice_result, Exception):
+        logger.warning(f"Whisper initialization failed: {voice_result}. Voice features may not work.")
+    else:
         logger.info("✓ Whisper initialized")
-    except Exception as e:
-        logger.warning(f"Whisper initialization failed: {e}. Voice features may not work.")
     
-    logger.info("Initializing CLIP model for image classification...")
-    try:
-        await vision_service.initialize()
+    if isinstance(vision_result, Exception):
+        logger.warning(f"CLIP initialization failed: {vision_result}. Image scan may not work.")
+    else:
         logger.info("✓ CLIP initialized")
-    except Exception as e:
-        logger.warning(f"CLIP initialization failed: {e}. Image scan may not work.")
     
     logger.info("ReNova backend started successfully")
     
@@ -58,6 +72,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down ReNova backend...")
+    await vision_service.close()
     await db.close_db()
     logger.info("ReNova backend shutdown complete")
 
@@ -19,8 +19,20 @@ class Database:
     @classmethod
     async def connect_db(cls):
         """Connect to MongoDB"""
+        if cls.client is not None:
+            return
+        
         try:
-            cls.client = AsyncIOMotorClient(settings.MONGODB_URL)
+            # Single shared client for the whole app; every collection getter
+            # reuses its connection pool
+            cls.client = AsyncIOMotorClient(
+                settings.MONGODB_URL,
+                maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                compressors=settings.MONGODB_COMPRESSORS
+            )
             cls.db = cls.client[settings.MONGODB_DB_NAME]
             
             # Test connection
@@ -32,6 +44,8 @@ class Database:
             
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
+            cls.client = None
+            cls.db = None
             raise
     
     @classmethod
@@ -39,6 +53,8 @@ class Database:
         """Close MongoDB connection"""
         if cls.client:
             cls.client.close()
+            cls.client = None
+            cls.db = None
             logger.info("Closed MongoDB connection")
     
     @classmethod
@@ -74,11 +90,13 @@ class Database:
                     logger.warning(f"Index creation warning for wallets.user_id: {e}")
             
             # Pending Items
-            await cls.db.pending_items.create_index([("user_id", ASCENDING)])
             await cls.db.pending_items.create_index([("status", ASCENDING)])
             await cls.db.pending_items.create_index([("location", GEOSPHERE)])
             await cls.db.pending_items.create_index([("created_at", DESCENDING)])
-            await cls.db.pending_items.create_index([("image_hash", ASCENDING)])
+            # Fraud checks: recent scans per user, duplicate hash within a time window.
+            # These prefixes also serve plain user_id / image_hash lookups.
+            await cls.db.pending_items.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+            await cls.db.pending_items.create_index([("image_hash", ASCENDING), ("created_at", DESCENDING)])
             
             # Completed Scans
             await cls.db.completed_scans.create_index([("user_id", ASCENDING)])
@@ -93,8 +111,9 @@ class Database:
                 if "duplicate key" not in str(e).lower():
                     logger.warning(f"Index creation warning for tokens.token_id: {e}")
             
-            await cls.db.tokens.create_index([("user_id", ASCENDING)])
             await cls.db.tokens.create_index([("status", ASCENDING)])
+            # Also serves plain user_id lookups
+            await cls.db.tokens.create_index([("user_id", ASCENDING), ("status", ASCENDING)])
             await cls.db.tokens.create_index([("expires_at", ASCENDING)])
             
             # Token Redemptions
@@ -2,7 +2,7 @@
 Token management service
 """
 import logging
-import random
+import secrets
 import string
 from datetime import datetime, timedelta
 from typing import Optional, Dict
@@ -14,14 +14,23 @@ from app.models.token_models import TokenModel, TokenRedemptionModel
 
 logger = logging.getLogger(__name__)
 
+# Byte -> token character table. Bytes at or above the largest multiple of
+# the alphabet size are deleted so every character is equally likely.
+_TOKEN_ALPHABET = (string.ascii_uppercase + string.digits).encode()
+_TOKEN_BYTE_LIMIT = 256 - 256 % len(_TOKEN_ALPHABET)
+_TOKEN_TABLE = bytes(_TOKEN_ALPHABET[b % len(_TOKEN_ALPHABET)] for b in range(256))
+_TOKEN_REJECT = bytes(range(_TOKEN_BYTE_LIMIT, 256))
+
 
 class TokenService:
     """Service for token/credit management"""
     
     def generate_token_id(self, length: int = 6) -> str:
         """Generate random token ID"""
-        chars = string.ascii_uppercase + string.digits
-        return ''.join(random.choice(chars) for _ in range(length))
+        token = b""
+        while len(token) < length:
+            token += secrets.token_bytes(length).translate(_TOKEN_TABLE, _TOKEN_REJECT)
+        return token[:length].decode()
     
     async def create_token(
         self,
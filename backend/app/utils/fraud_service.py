@@ -4,17 +4,28 @@ Fraud detection service
 import imagehash
 from PIL import Image
 import io
+import asyncio
 import logging
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 from datetime import datetime, timedelta
 from bson import ObjectId
 
+from app.config import settings
 from app.services.database import get_fraud_checks_collection, get_pending_items_collection
 from app.models.token_models import FraudCheckModel
 
 logger = logging.getLogger(__name__)
 
+# Order matches the weight vector below
+_FRAUD_CHECKS = ("duplicate_image", "internet_image", "gps_mismatch", "weight_sanity")
+_FRAUD_WEIGHTS = np.array([
+    settings.FRAUD_WEIGHT_DUPLICATE_IMAGE,
+    settings.FRAUD_WEIGHT_INTERNET_IMAGE,
+    settings.FRAUD_WEIGHT_GPS_MISMATCH,
+    settings.FRAUD_WEIGHT_WEIGHT_SANITY,
+], dtype=np.float32)
+
 
 class FraudService:
     """Service for detecting fraudulent scans"""
@@ -40,92 +51,140 @@ class FraudService:
             }
         """
         try:
-            # Compute image hash
-            image = Image.open(io.BytesIO(image_bytes))
-            img_hash = str(imagehash.average_hash(image))
-            
-            # Run all fraud checks
-            checks = {}
-            
-            # 1. Duplicate image check
-            checks["duplicate_image"] = await self._check_duplicate_image(
-                user_id, img_hash
-            )
-            
-            # 2. Internet image detection (CLIP similarity to stock images)
-            checks["internet_image"] = await self._check_internet_image(image_bytes)
-            
-            # 3. GPS mismatch check
-            checks["gps_mismatch"] = await self._check_gps_mismatch(
-                user_id, location_lat, location_lon
-            )
-            
-            # 4. Weight sanity check
-            checks["weight_sanity"] = self._check_weight_sanity(weight_kg)
-            
-            # Calculate fraud score
-            fraud_score = (
-                0.4 * checks["duplicate_image"]["score"] +
-                0.3 * checks["internet_image"]["score"] +
-                0.2 * checks["gps_mismatch"]["score"] +
-                0.1 * checks["weight_sanity"]["score"]
-            )
-            
-            is_suspicious = fraud_score > 0.5
-            
-            # Determine reason
-            reasons = []
-            if checks["duplicate_image"]["detected"]:
-                reasons.append("Duplicate image detected")
-            if checks["internet_image"]["detected"]:
-                reasons.append("Possible internet image")
-            if checks["gps_mismatch"]["detected"]:
-                reasons.append("GPS location mismatch")
-            if checks["weight_sanity"]["detected"]:
-                reasons.append("Unrealistic weight")
-            
-            reason = "; ".join(reasons) if reasons else "No issues detected"
-            
-            # Store fraud check
-            fraud_check = FraudCheckModel(
-                scan_id=ObjectId(scan_id),
-                user_id=ObjectId(user_id),
-                image_hash=img_hash,
-                duplicate_image_found=checks["duplicate_image"]["detected"],
-                internet_image_detected=checks["internet_image"]["detected"],
-                gps_mismatch=checks["gps_mismatch"]["detected"],
-                weight_sanity_failed=checks["weight_sanity"]["detected"],
-                fraud_score=fraud_score,
-                is_suspicious=is_suspicious,
-                reason=reason
+            result, fraud_doc = await self._evaluate_scan(
+                user_id, scan_id, image_bytes, location_lat, location_lon, weight_kg
             )
             
             fraud_collection = get_fraud_checks_collection()
-            await fraud_collection.insert_one(
-                fraud_check.model_dump(by_alias=True, exclude=["id"])
-            )
+            await fraud_collection.insert_one(fraud_doc)
             
-            logger.info(
-                f"Fraud check for scan {scan_id}: "
-                f"suspicious={is_suspicious}, score={fraud_score:.2f}"
-            )
-            
-            return {
-                "is_suspicious": is_suspicious,
-                "fraud_score": fraud_score,
-                "reason": reason,
-                "checks": checks
-            }
+            return result
             
         except Exception as e:
             logger.error(f"Fraud check failed: {e}")
             # Return non-suspicious on error
-            return {
-                "is_suspicious": False,
-                "fraud_score": 0.0,
-                "reason": "Fraud check failed",
-                "checks": {}
-            }
+            return self._failed_check_result()
+    
+    async def check_scan_fraud_batch(self, scans: List[Dict]) -> List[Dict]:
+        """
+        Run fraud checks for many scans and store them with one insert_many
+        
+        Args:
+            scans: list of check_scan_fraud keyword arguments
+        
+        Returns:
+            Results in the same order as scans
+        """
+        async def evaluate(scan: Dict) -> Tuple[Dict, Optional[Dict]]:
+            try:
+                return await self._evaluate_scan(**scan)
+            except Exception as e:
+                logger.error(f"Fraud check failed for scan {scan.get('scan_id')}: {e}")
+                return self._failed_check_result(), None
+        
+        evaluated = await asyncio.gather(*(evaluate(scan) for scan in scans))
+        
+        fraud_docs = [doc for _, doc in evaluated if doc is not None]
+        if fraud_docs:
+            try:
+                fraud_collection = get_fraud_checks_collection()
+                await fraud_collection.insert_many(fraud_docs, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to store fraud checks: {e}")
+        
+        return [result for result, _ in evaluated]
+    
+    async def _evaluate_scan(
+        self,
+        user_id: str,
+        scan_id: str,
+        image_bytes: bytes,
+        location_lat: float,
+        location_lon: float,
+        weight_kg: float
+    ) -> Tuple[Dict, Dict]:
+        """Run all checks and build the fraud check document (not stored)"""
+        # Compute image hash
+        image = Image.open(io.BytesIO(image_bytes))
+        img_hash = str(imagehash.average_hash(image))
+        
+        # Run all fraud checks
+        checks = {}
+        
+        # 1. Duplicate image check
+        checks["duplicate_image"] = await self._check_duplicate_image(
+            user_id, img_hash
+        )
+        
+        # 2. Internet image detection (CLIP similarity to stock images)
+        checks["internet_image"] = await self._check_internet_image(image_bytes)
+        
+        # 3. GPS mismatch check
+        checks["gps_mismatch"] = await self._check_gps_mismatch(
+            user_id, location_lat, location_lon
+        )
+        
+        # 4. Weight sanity check
+        checks["weight_sanity"] = self._check_weight_sanity(weight_kg)
+        
+        # Calculate fraud score
+        scores = np.array(
+            [checks[name]["score"] for name in _FRAUD_CHECKS],
+            dtype=np.float32
+        )
+        fraud_score = float(_FRAUD_WEIGHTS @ scores)
+        
+        is_suspicious = fraud_score > settings.FRAUD_THRESHOLD
+        
+        # Determine reason
+        reasons = []
+        if checks["duplicate_image"]["detected"]:
+            reasons.append("Duplicate image detected")
+        if checks["internet_image"]["detected"]:
+            reasons.append("Possible internet image")
+        if checks["gps_mismatch"]["detected"]:
+            reasons.append("GPS location mismatch")
+        if checks["weight_sanity"]["detected"]:
+            reasons.append("Unrealistic weight")
+        
+        reason = "; ".join(reasons) if reasons else "No issues detected"
+        
+        # Build fraud check record
+        fraud_check = FraudCheckModel(
+            scan_id=ObjectId(scan_id),
+            user_id=ObjectId(user_id),
+            image_hash=img_hash,
+            duplicate_image_found=checks["duplicate_image"]["detected"],
+            internet_image_detected=checks["internet_image"]["detected"],
+            gps_mismatch=checks["gps_mismatch"]["detected"],
+            weight_sanity_failed=checks["weight_sanity"]["detected"],
+            fraud_score=fraud_score,
+            is_suspicious=is_suspicious,
+            reason=reason
+        )
+        
+        logger.info(
+            f"Fraud check for scan {scan_id}: "
+            f"suspicious={is_suspicious}, score={fraud_score:.2f}"
+        )
+        
+        result = {
+            "is_suspicious": is_suspicious,
+            "fraud_score": fraud_score,
+            "reason": reason,
+            "checks": checks
+        }
+        
+        return result, fraud_check.model_dump(by_alias=True, exclude=["id"])
+    
+    def _failed_check_result(self) -> Dict:
+        """Non-suspicious result used when a check errors out"""
+        return {
+            "is_suspicious": False,
+            "fraud_score": 0.0,
+            "reason": "Fraud check failed",
+            "checks": {}
+        }
     
     async def _check_duplicate_image(self, user_id: str, img_hash: str) -> Dict:
         """Check if image hash already exists"""
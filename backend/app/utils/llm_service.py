@@ -4,7 +4,9 @@ LLM service using Groq for English reasoning
 import logging
 from typing import List, Dict, Optional
 import json
+import hashlib
 import httpx
+from cachetools import LRUCache
 
 from app.config import settings
 
@@ -24,13 +26,42 @@ from groq import AsyncGroq
 
 logger = logging.getLogger(__name__)
 
+# Common recyclables whose fallback guidance is as good as the LLM's
+TRIVIAL_MATERIALS = {
+    "PET", "HDPE", "Plastic", "Paper", "Cardboard", "Glass", "Aluminum", "Steel"
+}
+
 
 class LLMService:
     """Groq LLM service for waste intelligence reasoning"""
     
     def __init__(self):
-        self.client = AsyncGroq(api_key=settings.GROQ_API_KEY)
+        # One client for the process lifetime so the underlying httpx pool
+        # keeps TCP/TLS connections alive between requests
+        self.client = AsyncGroq(
+            api_key=settings.GROQ_API_KEY,
+            max_retries=2,
+            timeout=30.0
+        )
         self.model = "llama-3.3-70b-versatile"  # Updated model (3.1 decommissioned)
+        
+        # Translations are deterministic enough to reuse across users
+        self.translation_cache = LRUCache(maxsize=4096)
+    
+    def _translation_key(self, direction: str, text: str) -> str:
+        """Cache key for a translation request"""
+        return f"{direction}:{hashlib.sha256(text.encode()).hexdigest()}"
+    
+    async def _complete(self, **kwargs) -> str:
+        """Run a streamed chat completion and return the accumulated text"""
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        
+        return "".join(parts)
     
     async def reason_about_waste(
         self,
@@ -41,13 +72,30 @@ class LLMService:
         personal_docs: List[Dict],
         recycler_info: Optional[List[Dict]] = None,
         material: str = "",
-        weight_estimate: float = 0.0
+        weight_estimate: float = 0.0,
+        user_query: bool = True
     ) -> Dict:
         """
         Use LLM to reason about waste disposal, hazards, and recommendations
         
+        user_query is False when query is a generated description, not
+        something the user asked
+        
         Returns comprehensive response with all required fields
         """
+        # Confident, non-hazardous, common recyclable and no question from the
+        # user: the template answer is enough, skip the LLM round-trip
+        if (
+            not user_query
+            and not vision_labels.get('hazard_class')
+            and vision_labels.get('confidence', 0) > 0.9
+            and material in TRIVIAL_MATERIALS
+        ):
+            logger.info(f"Trivial {material} scan - using template response")
+            return self._fallback_response(
+                material, weight_estimate, vision_labels.get('cleanliness_score', 70)
+            )
+        
         try:
             # Build comprehensive prompt
             prompt = self._build_prompt(
@@ -61,7 +109,7 @@ class LLMService:
                 weight_estimate=weight_estimate
             )
             
-            # Call Groq
+            # Call Groq in JSON mode (not streamed: JSON mode needs the full object)
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
@@ -77,24 +125,23 @@ class LLMService:
                     }
                 ],
                 temperature=0.7,
-                max_tokens=1500
+                max_tokens=1500,
+                response_format={"type": "json_object"}
             )
             
-            # Parse response
             llm_text = response.choices[0].message.content
             
             # Parse structured output
             parsed = self._parse_llm_response(llm_text, vision_labels, material, weight_estimate)
             
-            # Add the full formatted response to preserve emojis and formatting
-            parsed["disposal_instruction"] = llm_text  # Use full LLM response with formatting
-            
             return parsed
             
         except Exception as e:
             logger.error(f"LLM reasoning failed: {e}")
             # Return fallback response
-            return self._fallback_response(material, weight_estimate)
+            return self._fallback_response(
+                material, weight_estimate, vision_labels.get('cleanliness_score', 70)
+            )
     
     def _build_prompt(
         self,
@@ -169,60 +216,22 @@ class LLMService:
         # Instructions
         prompt_parts.append(f"## Your Task")
         prompt_parts.append(
-            f"Provide comprehensive waste disposal guidance. "
-            f"CRITICAL: You MUST clearly separate general municipal guidelines from personalized user recommendations.\n"
-            f"\n"
-            f"Format your response EXACTLY like this:\n"
-            f"\n"
-            f"═══════════════════════════════════════════════════\n"
-            f"                      SUMMARY                       \n"
-            f"═══════════════════════════════════════════════════\n"
-            f"\n"
-            f"Material Type:          [e.g., PET Plastic]\n"
-            f"Recyclable:             [Yes/No]\n"
-            f"Recommended Action:     [Brief 1-2 sentence summary]\n"
-            f"Best Recycler:          [User's preferred recycler or closest option]\n"
-            f"Estimated Credits:      [X tokens]\n"
-            f"Environmental Impact:   [Key benefit in 1 sentence]\n"
-            f"\n"
-            f"═══════════════════════════════════════════════════\n"
-            f"\n"
-            f"**1. Disposal Instructions**\n"
-            f"\n"
-            f"Municipal Guidelines:\n"
-            f"[Use information from 'Municipal Rules & Guidelines' section above]\n"
-            f"- Step 1: ...\n"
-            f"- Step 2: ...\n"
-            f"\n"
-            f"Personalized Recommendations (Based on Your Past Behavior):\n"
-            f"[Use information from 'User's Past Behavior' section above]\n"
-            f"- You previously preferred...\n"
-            f"- Your usual practice is...\n"
-            f"\n"
-            f"**2. Hazard Notes**\n"
-            f"[Any safety warnings]\n"
-            f"\n"
-            f"**3. Cleaning Recommendations**\n"
-            f"[How to prepare for recycling]\n"
-            f"\n"
-            f"**4. Recycler Ranking**\n"
-            f"Your Preferred Recyclers: [If user has past recycler data, mention it here]\n"
-            f"Nearby Options: [List available recyclers from 'Available Recyclers' section]\n"
-            f"\n"
-            f"**5. Route Summary**\n"
-            f"[Transportation suggestions]\n"
-            f"\n"
-            f"**6. Estimated Credits**\n"
-            f"[Token calculation]\n"
-            f"\n"
-            f"**7. Environmental Impact**\n"
-            f"[CO₂, water, landfill savings]\n"
-            f"\n"
-            f"**8. Pickup Suggestions**\n"
-            f"[Scheduling recommendations]\n"
-            f"\n"
-            f"**9. Citations**\n"
-            f"[Which guidelines you referenced]\n"
+            "Provide comprehensive waste disposal guidance. "
+            "CRITICAL: You MUST clearly separate general municipal guidelines from personalized user recommendations.\n"
+            "\n"
+            "Respond with a single JSON object with exactly these keys:\n"
+            "- disposal_instruction (string): start with a SUMMARY block listing Material Type, Recyclable (Yes/No), "
+            "Recommended Action, Best Recycler, Estimated Credits and Environmental Impact, one per line. "
+            "Then a 'Municipal Guidelines:' section with step-by-step instructions drawn from the "
+            "'Municipal Rules & Guidelines' above, and a 'Personalized Recommendations (Based on Your Past Behavior):' "
+            "section drawn from the 'User's Past Behavior' above\n"
+            "- hazard_notes (string): any safety warnings\n"
+            "- cleaning_recommendation (string): how to prepare the item for recycling\n"
+            "- recycler_ranking (array of strings): the user's preferred recyclers first, then nearby options "
+            "from 'Available Recyclers'\n"
+            "- route_summary (string): transportation suggestions\n"
+            "- pickup_suggestions (array of strings): scheduling recommendations\n"
+            "- citations (array of strings): which guidelines you referenced\n"
         )
         
         return "\n".join(prompt_parts)
@@ -234,11 +243,10 @@ class LLMService:
         material: str,
         weight_estimate: float
     ) -> Dict:
-        """Parse LLM response into structured format"""
+        """Parse LLM JSON response into structured format"""
         
         logger.info(f"Parsing LLM response (length: {len(llm_text)} chars)")
         
-        # Extract sections (basic parsing)
         sections = {
             "disposal_instruction": "",
             "hazard_notes": "",
@@ -253,73 +261,24 @@ class LLMService:
             "citations": []
         }
         
-        # Simple section extraction
-        lines = llm_text.split('\n')
-        current_section = None
-        section_content = []
+        try:
+            data = json.loads(llm_text)
+        except json.JSONDecodeError:
+            logger.warning("LLM response was not valid JSON, using full text")
+            data = {}
         
-        for line in lines:
-            line_lower = line.lower().strip()
+        if isinstance(data, dict):
+            for key in ("disposal_instruction", "hazard_notes", "cleaning_recommendation", "route_summary"):
+                value = data.get(key)
+                if value:
+                    sections[key] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
             
-            # Check for section headers (look for numbered items or bold markers)
-            if '1.' in line or '**disposal' in line_lower or 'disposal instruction' in line_lower:
-                if current_section and section_content:
-                    sections[current_section] = '\n'.join(section_content).strip()
-                current_section = 'disposal_instruction'
-                section_content = []
-            elif '2.' in line or '**hazard' in line_lower or 'hazard note' in line_lower:
-                if current_section and section_content:
-                    sections[current_section] = '\n'.join(section_content).strip()
-                current_section = 'hazard_notes'
-                section_content = []
-            elif '3.' in line or '**cleaning' in line_lower or 'cleaning recommend' in line_lower:
-                if current_section and section_content:
-                    sections[current_section] = '\n'.join(section_content).strip()
-                current_section = 'cleaning_recommendation'
-                section_content = []
-            elif '4.' in line or '**recycler' in line_lower or 'recycler rank' in line_lower:
-                if current_section and section_content:
-                    sections[current_section] = '\n'.join(section_content).strip()
-                current_section = 'recycler_ranking'
-                section_content = []
-            elif '5.' in line or '**route' in line_lower or 'route summary' in line_lower:
-                if current_section and section_content:
-                    sections[current_section] = '\n'.join(section_content).strip()
-                current_section = 'route_summary'
-                section_content = []
-            elif current_section and line.strip() and not line.startswith('#'):
-                # Add content to current section (skip header lines)
-                cleaned_line = line.replace('**', '').strip()
-                if cleaned_line and not cleaned_line.endswith(':'):
-                    section_content.append(cleaned_line)
-        
-        # Save last section
-        if current_section and section_content:
-            # Keep as list for list fields, join for string fields
-            if current_section in ['recycler_ranking', 'pickup_suggestions', 'citations']:
-                sections[current_section] = section_content
-            else:
-                sections[current_section] = '\n'.join(section_content).strip()
-        
-        # Post-process sections - ensure list fields are lists
-        if isinstance(sections['recycler_ranking'], str):
-            # If it's a string, split by newlines and filter empty
-            sections['recycler_ranking'] = [
-                line.strip() for line in sections['recycler_ranking'].split('\n') 
-                if line.strip() and not line.strip().startswith('#')
-            ]
-        
-        if isinstance(sections['pickup_suggestions'], str):
-            sections['pickup_suggestions'] = [
-                line.strip() for line in sections['pickup_suggestions'].split('\n') 
-                if line.strip() and not line.strip().startswith('#')
-            ]
-        
-        if isinstance(sections['citations'], str):
-            sections['citations'] = [
-                line.strip() for line in sections['citations'].split('\n') 
-                if line.strip() and not line.strip().startswith('#')
-            ]
+            for key in ("recycler_ranking", "pickup_suggestions", "citations"):
+                value = data.get(key)
+                if isinstance(value, list):
+                    sections[key] = [str(item) for item in value]
+                elif value:
+                    sections[key] = [str(value)]
         
         # Fallback: if disposal_instruction is empty, use the entire response
         if not sections['disposal_instruction'].strip():
@@ -339,7 +298,7 @@ class LLMService:
         
         return sections
     
-    def _fallback_response(self, material: str, weight_estimate: float) -> Dict:
+    def _fallback_response(self, material: str, weight_estimate: float, cleanliness_score: float = 70) -> Dict:
         """Fallback response if LLM fails"""
         
         from app.impact.impact_service import impact_service
@@ -351,7 +310,7 @@ class LLMService:
             "cleaning_recommendation": "Rinse the item with water and let it dry.",
             "recycler_ranking": [],
             "route_summary": "Check nearby recyclers for the best route.",
-            "estimated_credits": impact_service.calculate_credits(material, weight_estimate, 70),
+            "estimated_credits": impact_service.calculate_credits(material, weight_estimate, cleanliness_score),
             "co2_saved_kg": impact_service.calculate_co2_saved(material, weight_estimate),
             "water_saved_liters": impact_service.calculate_water_saved(material, weight_estimate),
             "landfill_saved_kg": impact_service.calculate_landfill_saved(material, weight_estimate),
@@ -364,8 +323,13 @@ class LLMService:
         Translate English text to Hindi using local Whisper or Groq
         Note: For better translation, we use Groq's LLM
         """
+        cache_key = self._translation_key("hi", english_text)
+        cached = self.translation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = await self.client.chat.completions.create(
+            response_text = await self._complete(
                 model="llama-3.2-3b-preview",  # Updated faster model
                 messages=[
                     {
@@ -382,7 +346,8 @@ class LLMService:
                 max_tokens=2000
             )
             
-            hindi_text = response.choices[0].message.content.strip()
+            hindi_text = response_text.strip()
+            self.translation_cache[cache_key] = hindi_text
             return hindi_text
             
         except Exception as e:
@@ -393,8 +358,13 @@ class LLMService:
         """
         Translate Hindi text to English using Groq
         """
+        cache_key = self._translation_key("en", hindi_text)
+        cached = self.translation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = await self.client.chat.completions.create(
+            response_text = await self._complete(
                 model="llama-3.2-3b-preview",  # Updated faster model
                 messages=[
                     {
@@ -411,7 +381,8 @@ class LLMService:
                 max_tokens=2000
             )
             
-            english_text = response.choices[0].message.content.strip()
+            english_text = response_text.strip()
+            self.translation_cache[cache_key] = english_text
             return english_text
             
         except Exception as e:
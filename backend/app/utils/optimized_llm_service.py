@@ -2,15 +2,131 @@
 Cost-optimized LLM service with caching and smart routing
 """
 from groq import AsyncGroq
+import asyncio
 import logging
-from typing import List, Dict, Optional
+from array import array
+import re
+from typing import List, Dict, Optional, Set, Tuple
 import hashlib
-from cachetools import TTLCache
+from time import monotonic
+from cachetools import LRUCache
 
 from app.config import settings
+from app.utils.query_router import QueryRouter
 
 logger = logging.getLogger(__name__)
 
+# Keywords that mark a query as simple (fast model) or answerable by rules
+SIMPLE_KEYWORDS = [
+    "what is", "how to", "where", "recycle", "dispose", 
+    "identify", "is this", "can i"
+]
+RULE_KEYWORDS = [
+    "how to recycle", "how to dispose", "what to do",
+    "is recyclable", "can recycle", "disposal method",
+    "how do i", "where to", "recycle this"
+]
+
+# One alternation per tag so a query is scanned in C instead of N substring tests
+_KEYWORD_PATTERNS = {
+    "simple": re.compile("|".join(map(re.escape, SIMPLE_KEYWORDS))),
+    "rules": re.compile("|".join(map(re.escape, RULE_KEYWORDS))),
+}
+
+# Usage counters, stored as slots of one unsigned int64 array
+STAT_TOTAL_CALLS = 0
+STAT_CACHE_HITS = 1
+STAT_RULE_BASED = 2
+STAT_FAST_MODEL_CALLS = 3
+STAT_SMART_MODEL_CALLS = 4
+STAT_TOTAL_TOKENS = 5
+STAT_ESCALATIONS = 6
+STAT_LLM_REQUESTS = 7  # Requests answered by the LLM, however many model calls they took
+STAT_CASCADE_CALLS = 8  # Complex requests eligible to escalate
+STAT_NAMES = (
+    "total_calls",
+    "cache_hits",
+    "rule_based",
+    "fast_model_calls",
+    "smart_model_calls",
+    "total_tokens",
+    "escalations",
+    "llm_requests",
+    "cascade_calls",
+)
+
+# Complex queries try the fast model first and escalate below this self-rating
+CONFIDENCE_INSTRUCTION = (
+    " End with a final line 'CONFIDENCE: <0-1>' rating how sure you are the advice is correct."
+)
+_CONFIDENCE_LINE = re.compile(r"\s*\**CONFIDENCE\**\s*:\s*\**\s*([01](?:\.\d+)?)\**\s*$", re.IGNORECASE)
+
+# Generation budgets picked per query by _predict_max_tokens
+MAX_TOKENS_SHORT = 128
+MAX_TOKENS_MEDIUM = 256
+MAX_TOKENS_LONG = 800
+_MULTI_PART = re.compile(r"(?:^|\n)\s*\d+[.)]\s")
+
+_MISSING = object()
+
+# Cached in place of a response after an LLM failure so retries back off
+_LLM_FAILED = object()
+LLM_FAILURE_TTL = 30  # seconds
+
+
+class ShardedTTLCache:
+    """
+    TTL cache split into independent LRU shards.
+    
+    Each entry stores its own expiry, checked lazily on read, so there is no
+    global expiration list to walk on every access like cachetools.TTLCache.
+    """
+    
+    __slots__ = ("ttl", "_mask", "_shards")
+    
+    def __init__(self, maxsize: int, ttl: float, shards: int = 8):
+        # Shard count must be a power of two so the index is a bit mask
+        self.ttl = ttl
+        self._mask = shards - 1
+        self._shards = [LRUCache(maxsize=max(1, maxsize // shards)) for _ in range(shards)]
+    
+    def _shard(self, key) -> LRUCache:
+        return self._shards[hash(key) & self._mask]
+    
+    def get(self, key, default=None):
+        shard = self._shard(key)
+        entry = shard.get(key)
+        if entry is None:
+            return default
+        
+        value, expires_at = entry
+        if expires_at < monotonic():
+            shard.pop(key, None)
+            return default
+        return value
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._shard(key)[key] = (value, monotonic() + (self.ttl if ttl is None else ttl))
+    
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        self.set(key, value)
+    
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+    
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
 
 class OptimizedLLMService:
     """
@@ -28,8 +144,16 @@ class OptimizedLLMService:
         self.fast_model = "llama-3.1-8b-instant"  # Groq, FREE & FAST
         self.smart_model = "llama-3.3-70b-versatile"  # Groq, FREE & SMART
         
+        # Learned fast/smart router; None keeps the keyword heuristics
+        self.router = QueryRouter.load(settings.LLM_ROUTER_WEIGHTS, settings.LLM_ROUTER_THRESHOLD)
+        if self.router is not None:
+            logger.info("Loaded LLM router weights from %s", settings.LLM_ROUTER_WEIGHTS)
+        
         # Cache responses for 1 hour (1000 most recent queries)
-        self.response_cache = TTLCache(maxsize=1000, ttl=3600)
+        self.response_cache = ShardedTTLCache(maxsize=1024, ttl=3600)
+        
+        # Cache key -> future of the LLM call currently computing it
+        self._inflight: Dict[str, asyncio.Future] = {}
         
         # Pre-defined rules for common materials (70% of queries)
         self.disposal_rules = {
@@ -71,59 +195,69 @@ class OptimizedLLMService:
             }
         }
         
-        # Usage tracking
-        self.stats = {
-            "total_calls": 0,
-            "cache_hits": 0,
-            "rule_based": 0,
-            "fast_model_calls": 0,
-            "smart_model_calls": 0,
-            "total_tokens": 0
+        # Static part of each rule response; only the numbers vary per request
+        self._rule_templates = {
+            material: (
+                {
+                    "disposal_instruction": rule["disposal"],
+                    "cleaning_recommendation": rule["cleaning"],
+                    "hazard_notes": rule["hazards"],
+                    "hazard_class": "Hazardous" if rule["hazards"] else None,
+                    "material": material,
+                    "citations": ("Material Database", "Recycling Guidelines"),
+                    "method": "rules"  # For tracking
+                },
+                rule["credits_per_kg"]
+            )
+            for material, rule in self.disposal_rules.items()
         }
+        
+        # Usage tracking (indexed by the STAT_* constants)
+        self._stats = array("Q", [0] * len(STAT_NAMES))
+    
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Usage counters as a dict"""
+        return dict(zip(STAT_NAMES, self._stats))
+    
+    def reset_stats(self):
+        """Zero all usage counters"""
+        for i in range(len(self._stats)):
+            self._stats[i] = 0
     
     def _get_cache_key(self, query: str, material: str, cleanliness: int) -> str:
         """Generate cache key from query parameters"""
         key_string = f"{query.lower().strip()}_{material}_{cleanliness//10}"  # Round cleanliness to 10s
-        return hashlib.md5(key_string.encode()).hexdigest()
+        # Non-cryptographic use: 8-byte BLAKE2b is plenty for a dict key and cheaper than MD5
+        return hashlib.blake2b(key_string.encode(), digest_size=8).hexdigest()
     
-    def _is_simple_query(self, query: str) -> bool:
+    def _scan(self, query_lower: str) -> Set[str]:
+        """Return the keyword tags ("simple", "rules") found in a lowercased query"""
+        return {tag for tag, pattern in _KEYWORD_PATTERNS.items() if pattern.search(query_lower)}
+    
+    def _is_simple_query(self, query_lower: str, tags: Set[str]) -> bool:
         """Determine if query is simple enough for fast model or rules"""
-        simple_keywords = [
-            "what is", "how to", "where", "recycle", "dispose", 
-            "identify", "is this", "can i"
-        ]
-        
-        query_lower = query.lower()
+        if self.router is not None:
+            return not self.router.needs_smart_model(query_lower)
         
         # Simple if:
         # 1. Contains simple keywords
         # 2. Short query (<15 words)
         # 3. Single question mark
         is_simple = (
-            any(keyword in query_lower for keyword in simple_keywords) or
-            len(query.split()) < 15 or
-            query.count("?") <= 1
+            "simple" in tags or
+            len(query_lower.split()) < 15 or
+            query_lower.count("?") <= 1
         )
         
         return is_simple
     
-    def _can_use_rules(self, query: str, material: str) -> bool:
+    def _can_use_rules(self, tags: Set[str], material: str) -> bool:
         """Check if we can use rule-based response"""
         # Use rules if:
         # 1. Material has rules defined
         # 2. Query is basic disposal/recycling question
-        basic_queries = [
-            "how to recycle", "how to dispose", "what to do",
-            "is recyclable", "can recycle", "disposal method",
-            "how do i", "where to", "recycle this"
-        ]
-        
-        query_lower = query.lower()
-        
-        return (
-            material in self.disposal_rules and
-            any(basic in query_lower for basic in basic_queries)
-        )
+        return material in self.disposal_rules and "rules" in tags
     
     async def get_disposal_advice(
         self,
@@ -135,101 +269,189 @@ class OptimizedLLMService:
     ) -> Dict:
         """
         Get disposal advice using most cost-effective method:
-        1. Check cache (FREE)
-        2. Try rule-based system (FREE)
+        1. Try rule-based system (FREE)
+        2. Check cache (FREE)
         3. Use fast model for simple queries (CHEAP)
-        4. Use smart model for complex queries (MODERATE)
+        4. Complex queries: fast model first, smart model if it isn't confident (MODERATE)
         """
         
-        self.stats["total_calls"] += 1
+        self._stats[STAT_TOTAL_CALLS] += 1
         
-        # Step 1: Check cache
-        cache_key = self._get_cache_key(query, material, cleanliness_score)
-        if cache_key in self.response_cache:
-            self.stats["cache_hits"] += 1
-            cache_rate = (self.stats["cache_hits"] / self.stats["total_calls"]) * 100
-            logger.info(f"💰 Cache HIT! ({cache_rate:.1f}% hit rate) - $0 cost")
-            return self.response_cache[cache_key]
+        query_lower = query.lower()
+        tags = self._scan(query_lower)
         
-        # Step 2: Try rule-based system
-        if self._can_use_rules(query, material):
-            self.stats["rule_based"] += 1
-            logger.info(f"📋 Using rules for {material} - $0 cost")
+        # Step 1: Try rule-based system (answered before any cache key is hashed)
+        if self._can_use_rules(tags, material):
+            self._stats[STAT_RULE_BASED] += 1
+            logger.info("📋 Using rules for %s - $0 cost", material)
             
-            rule = self.disposal_rules[material]
-            response = {
-                "disposal_instruction": rule["disposal"],
-                "cleaning_recommendation": rule["cleaning"],
-                "hazard_notes": rule["hazards"] or hazard_detected,
-                "hazard_class": "Hazardous" if rule["hazards"] else None,
-                "estimated_credits": int(weight_kg * rule["credits_per_kg"] * (cleanliness_score / 100)),
-                "material": material,
+            template, credits_per_kg = self._rule_templates[material]
+            hazard_notes = template["hazard_notes"]
+            return {
+                **template,
+                "hazard_notes": hazard_detected if hazard_notes is None else hazard_notes,
+                "estimated_credits": int(weight_kg * credits_per_kg * cleanliness_score) // 100,
                 "co2_saved_kg": weight_kg * 2.5,
                 "water_saved_liters": weight_kg * 50,
                 "landfill_saved_kg": weight_kg,
-                "citations": ["Material Database", "Recycling Guidelines"],
-                "method": "rules"  # For tracking
             }
-            
-            # Cache it
-            self.response_cache[cache_key] = response
-            return response
         
-        # Step 3 & 4: Use LLM (fast or smart based on complexity)
-        is_simple = self._is_simple_query(query)
-        model = self.fast_model if is_simple else self.smart_model
+        # Step 2: Check cache of model-generated responses
+        cache_key = self._get_cache_key(query, material, cleanliness_score)
+        cached = self.response_cache.get(cache_key)
+        if cached is _LLM_FAILED:
+            logger.info("Recent LLM failure for this query - using fallback")
+            return self._llm_fallback(material, weight_kg)
+        if cached is not None:
+            self._stats[STAT_CACHE_HITS] += 1
+            if logger.isEnabledFor(logging.INFO):
+                cache_rate = (self._stats[STAT_CACHE_HITS] / self._stats[STAT_TOTAL_CALLS]) * 100
+                logger.info("💰 Cache HIT! (%.1f%% hit rate) - $0 cost", cache_rate)
+            return cached
+        
+        # Identical request already waiting on the LLM: share its answer
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            logger.info("Joining in-flight LLM call")
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            response = await self._llm_advice(
+                query, query_lower, tags, material, cleanliness_score, weight_kg, cache_key
+            )
+        except BaseException:
+            # Owner failed or was cancelled: joiners get the fallback answer
+            # instead of the owner's exception (or CancelledError)
+            future.set_result(self._llm_fallback(material, weight_kg))
+            raise
+        finally:
+            del self._inflight[cache_key]
+        
+        future.set_result(response)
+        return response
+    
+    async def _llm_advice(
+        self,
+        query: str,
+        query_lower: str,
+        tags: Set[str],
+        material: str,
+        cleanliness_score: int,
+        weight_kg: float,
+        cache_key: str
+    ) -> Dict:
+        """Steps 3 & 4: answer with the fast or smart model and cache the result"""
+        is_simple = self._is_simple_query(query_lower, tags)
+        max_tokens = self._predict_max_tokens(query_lower, tags)
         
-        if is_simple:
-            self.stats["fast_model_calls"] += 1
-            logger.info(f"⚡ Using FAST model - Low cost")
-        else:
-            self.stats["smart_model_calls"] += 1
-            logger.info(f"🧠 Using SMART model - Moderate cost")
+        self._stats[STAT_LLM_REQUESTS] += 1
         
         try:
             # Build compact prompt
             prompt = self._build_compact_prompt(query, material, cleanliness_score, weight_kg)
             
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Expert waste management AI. Respond concisely in English."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=800  # Reduced from 1500 to save costs
-            )
-            
-            # Track usage
-            tokens_used = response.usage.total_tokens
-            self.stats["total_tokens"] += tokens_used
-            
-            llm_text = response.choices[0].message.content
+            if is_simple:
+                logger.info("⚡ Using FAST model - Low cost")
+                llm_text, _ = await self._complete(self.fast_model, prompt, max_tokens)
+                method = "llm_fast"
+            else:
+                # Cascade: accept the fast model's answer if it is confident enough
+                self._stats[STAT_CASCADE_CALLS] += 1
+                llm_text, confidence = await self._complete(
+                    self.fast_model, prompt, max_tokens, ask_confidence=True
+                )
+                method = "llm_fast"
+                if confidence is None or confidence < settings.LLM_CASCADE_THRESHOLD:
+                    self._stats[STAT_ESCALATIONS] += 1
+                    logger.info("🧠 Escalating to SMART model (fast confidence %s)", confidence)
+                    llm_text, _ = await self._complete(self.smart_model, prompt, max_tokens)
+                    method = "llm_smart"
             
             # Parse and cache
             parsed = self._parse_llm_response(llm_text, material, weight_kg, cleanliness_score)
-            parsed["method"] = "llm_fast" if is_simple else "llm_smart"
+            parsed["method"] = method
             
             self.response_cache[cache_key] = parsed
             
-            logger.info(f"📊 Stats: {self.stats}")
+            # Sample the full stats dump instead of rendering it on every call
+            if self._stats[STAT_TOTAL_CALLS] % 100 == 0:
+                logger.info("📊 Stats: %s", self.stats)
             
             return parsed
             
         except Exception as e:
-            logger.error(f"LLM call failed: {e}")
-            # Fallback to rules if available
-            if material in self.disposal_rules:
-                return self.disposal_rules[material]
-            
-            # Ultimate fallback
-            return self._fallback_response(material, weight_kg)
+            logger.error("LLM call failed: %s", e)
+            self.response_cache.set(cache_key, _LLM_FAILED, ttl=LLM_FAILURE_TTL)
+            return self._llm_fallback(material, weight_kg)
+    
+    def _predict_max_tokens(self, query_lower: str, tags: Set[str]) -> int:
+        """Size the generation budget from the query's shape"""
+        # Multi-part: numbered list or several questions
+        if query_lower.count("?") > 1 or _MULTI_PART.search(query_lower):
+            return MAX_TOKENS_LONG
+        
+        # Single-line question close to what the rules already answer
+        if "simple" in tags and "\n" not in query_lower and len(query_lower.split()) < 15:
+            return MAX_TOKENS_SHORT
+        
+        return MAX_TOKENS_MEDIUM
+    
+    async def _complete(
+        self, model: str, prompt: str, max_tokens: int, ask_confidence: bool = False
+    ) -> Tuple[str, Optional[float]]:
+        """One chat completion; optionally asks for and strips a trailing confidence line"""
+        # Billing and latency scale with generated tokens, so also ask for a
+        # matching word limit instead of relying on truncation
+        system = (
+            "Expert waste management AI. Respond concisely in English. "
+            f"Respond in at most {max_tokens * 3 // 4} words."
+        )
+        if ask_confidence:
+            system += CONFIDENCE_INSTRUCTION
+        
+        self._stats[STAT_FAST_MODEL_CALLS if model == self.fast_model else STAT_SMART_MODEL_CALLS] += 1
+        
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": system
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens
+        )
+        
+        # Track usage
+        self._stats[STAT_TOTAL_TOKENS] += response.usage.total_tokens
+        logger.debug(
+            "max_tokens predicted %d, generated %d", max_tokens, response.usage.completion_tokens
+        )
+        
+        text = response.choices[0].message.content
+        if not ask_confidence:
+            return text, None
+        
+        match = _CONFIDENCE_LINE.search(text)
+        if match is None:
+            return text, None
+        return text[:match.start()].rstrip(), float(match.group(1))
+    
+    def _llm_fallback(self, material: str, weight: float) -> Dict:
+        """Response used when the LLM is unavailable"""
+        # Fallback to rules if available
+        if material in self.disposal_rules:
+            return self.disposal_rules[material]
+        
+        # Ultimate fallback
+        return self._fallback_response(material, weight)
     
     def _build_compact_prompt(
         self, query: str, material: str, cleanliness: int, weight: float
@@ -273,16 +495,20 @@ Provide brief advice on:
     
     def get_stats(self) -> Dict:
         """Get usage statistics"""
-        total = self.stats["total_calls"]
+        stats = self.stats
+        total = stats["total_calls"]
         if total == 0:
-            return self.stats
+            return stats
+        
+        llm_calls = stats["fast_model_calls"] + stats["smart_model_calls"]
         
         return {
-            **self.stats,
-            "cache_hit_rate": f"{(self.stats['cache_hits'] / total) * 100:.1f}%",
-            "rule_based_rate": f"{(self.stats['rule_based'] / total) * 100:.1f}%",
-            "llm_usage_rate": f"{((self.stats['fast_model_calls'] + self.stats['smart_model_calls']) / total) * 100:.1f}%",
-            "avg_tokens_per_call": self.stats["total_tokens"] / max(1, self.stats["fast_model_calls"] + self.stats["smart_model_calls"]),
+            **stats,
+            "cache_hit_rate": f"{(stats['cache_hits'] / total) * 100:.1f}%",
+            "rule_based_rate": f"{(stats['rule_based'] / total) * 100:.1f}%",
+            "llm_usage_rate": f"{(stats['llm_requests'] / total) * 100:.1f}%",
+            "escalation_rate": f"{(stats['escalations'] / max(1, stats['cascade_calls'])) * 100:.1f}%",
+            "avg_tokens_per_call": stats["total_tokens"] / max(1, llm_calls),
             "estimated_cost_usd": 0.0  # Groq is FREE!
         }
 
@@ -0,0 +1,70 @@
+"""
+Learned fast/smart model router for LLM queries
+"""
+import logging
+import os
+import zlib
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Hashed character trigram buckets, followed by a few dense query statistics
+HASH_BUCKETS = 512
+DENSE_FEATURES = 4
+FEATURE_DIM = HASH_BUCKETS + DENSE_FEATURES
+
+
+def route_features(query_lower: str) -> np.ndarray:
+    """Featurize a lowercased query for the router (float32, FEATURE_DIM long)"""
+    padded = f" {query_lower} "
+    buckets = [
+        zlib.crc32(padded[i:i + 3].encode()) % HASH_BUCKETS
+        for i in range(len(padded) - 2)
+    ]
+    
+    x = np.zeros(FEATURE_DIM, dtype=np.float32)
+    if buckets:
+        counts = np.bincount(buckets, minlength=HASH_BUCKETS).astype(np.float32)
+        # L2-normalize so long queries don't dominate the n-gram part
+        x[:HASH_BUCKETS] = counts / np.linalg.norm(counts)
+    
+    x[HASH_BUCKETS] = len(query_lower) / 100.0
+    x[HASH_BUCKETS + 1] = len(query_lower.split()) / 20.0
+    x[HASH_BUCKETS + 2] = query_lower.count("?")
+    x[HASH_BUCKETS + 3] = sum(ch.isdigit() for ch in query_lower) / 10.0
+    return x
+
+
+class QueryRouter:
+    """Logistic regression over route_features: P(query needs the smart model)"""
+    
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5):
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.threshold = threshold
+    
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.5) -> Optional["QueryRouter"]:
+        """Load weights saved by scripts/train_router.py, or None if unavailable"""
+        if not path or not os.path.exists(path):
+            return None
+        
+        try:
+            data = np.load(path)
+            weights = data["weights"]
+            if weights.shape != (FEATURE_DIM,):
+                logger.warning("Router weights at %s have shape %s, expected (%d,)", path, weights.shape, FEATURE_DIM)
+                return None
+            return cls(weights, data["bias"], threshold)
+        except Exception as e:
+            logger.warning("Failed to load router weights from %s: %s", path, e)
+            return None
+    
+    def smart_probability(self, query_lower: str) -> float:
+        z = float(self.weights @ route_features(query_lower)) + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+    
+    def needs_smart_model(self, query_lower: str) -> bool:
+        return self.smart_probability(query_lower) > self.threshold
@@ -0,0 +1,190 @@
+"""
+Alternative CLIP runtimes exposing the HF CLIPModel feature API
+"""
+import json
+import logging
+import os
+from typing import Dict
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+_NUMPY_DTYPES = {
+    torch.float32: np.float32,
+    torch.float16: np.float16,
+    torch.int64: np.int64,
+}
+
+
+class OpenAIJitCLIP:
+    """openai/CLIP TorchScript model behind get_image_features/get_text_features"""
+    
+    def __init__(self, name: str, device: str):
+        import clip
+        
+        # jit=True loads the traced archive: each tower is one TorchScript call
+        self.model, _ = clip.load(name, device=device, jit=True)
+        self.model.eval()
+        self._clip_tokenize = clip.tokenize
+        
+        # The archive ships fp16 weights; clip.load patches them to fp32 on CPU
+        self.dtype = torch.float16 if device == "cuda" else torch.float32
+        self.logit_scale = self.model.logit_scale
+    
+    def tokenize(self, texts):
+        """Tokenize to the fixed 77-token context the traced text tower expects"""
+        return {"input_ids": self._clip_tokenize(texts, truncate=True)}
+    
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_image(pixel_values)
+    
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask=None) -> torch.Tensor:
+        # Causal mask + EOT pooling are baked into the trace, no attention mask needed
+        return self.model.encode_text(input_ids)
+
+
+class OnnxCLIP:
+    """CLIP towers exported to ONNX and run through ONNX Runtime IOBinding"""
+    
+    def __init__(self, name: str, device: str, cache_dir: str):
+        import onnxruntime as ort
+        
+        self.device = device
+        self.dtype = torch.float32
+        
+        vision_path = os.path.join(cache_dir, "vision.onnx")
+        text_path = os.path.join(cache_dir, "text.onnx")
+        meta_path = os.path.join(cache_dir, "meta.json")
+        if not all(os.path.exists(p) for p in (vision_path, text_path, meta_path)):
+            _export_onnx(name, cache_dir, vision_path, text_path, meta_path)
+        
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.embed_dim = meta["embed_dim"]
+        self.logit_scale = torch.tensor(meta["logit_scale"])
+        
+        if device == "cuda":
+            providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        else:
+            providers = ["CPUExecutionProvider"]
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        self._vision = ort.InferenceSession(vision_path, options, providers=providers)
+        self._text = ort.InferenceSession(text_path, options, providers=providers)
+        
+        # The CPU-only onnxruntime wheel silently drops CUDAExecutionProvider, so
+        # bind buffers wherever the session actually runs, not where torch does
+        active = self._vision.get_providers()
+        self._ort_device = "cuda" if "CUDAExecutionProvider" in active else "cpu"
+        if device == "cuda" and self._ort_device == "cpu":
+            logger.warning("ONNX Runtime has no CUDA provider (install onnxruntime-gpu); CLIP onnx backend runs on CPU")
+    
+    def _run(self, session, inputs: Dict[str, torch.Tensor], output_name: str) -> torch.Tensor:
+        """One native graph call reading and writing torch-owned buffers in place"""
+        batch = next(iter(inputs.values())).shape[0]
+        output = torch.empty((batch, self.embed_dim), dtype=torch.float32, device=self._ort_device)
+        
+        # Held until the run returns: the binding only keeps raw pointers
+        inputs = {k: v.to(self._ort_device).contiguous() for k, v in inputs.items()}
+        
+        binding = session.io_binding()
+        for input_name, tensor in inputs.items():
+            binding.bind_input(
+                input_name,
+                device_type=self._ort_device,
+                device_id=0,
+                element_type=_NUMPY_DTYPES[tensor.dtype],
+                shape=tuple(tensor.shape),
+                buffer_ptr=tensor.data_ptr(),
+            )
+        binding.bind_output(
+            output_name,
+            device_type=self._ort_device,
+            device_id=0,
+            element_type=np.float32,
+            shape=tuple(output.shape),
+            buffer_ptr=output.data_ptr(),
+        )
+        
+        if self._ort_device == "cuda":
+            # ORT runs on its own stream: inputs may still be in flight from
+            # non_blocking copies queued on torch's stream
+            torch.cuda.current_stream().synchronize()
+        session.run_with_iobinding(binding)
+        return output.to(self.device)
+    
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self._run(self._vision, {"pixel_values": pixel_values}, "image_embeds")
+    
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self._run(
+            self._text,
+            {"input_ids": input_ids, "attention_mask": attention_mask},
+            "text_embeds",
+        )
+
+
+class _ImageTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def _export_onnx(name: str, cache_dir: str, vision_path: str, text_path: str, meta_path: str):
+    """Export both CLIP towers once; later startups load the cached graphs"""
+    from transformers import CLIPModel
+    
+    logger.info("Exporting %s to ONNX in %s (first run only)", name, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    model = CLIPModel.from_pretrained(name).eval()
+    config = model.config
+    
+    image_size = config.vision_config.image_size
+    # no_grad rather than inference_mode: ONNX export traces the model, and
+    # tracing needs regular (non-inference) tensors
+    with torch.no_grad():
+        torch.onnx.export(
+            _ImageTower(model),
+            (torch.zeros(1, 3, image_size, image_size),),
+            vision_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+        
+        tokens = torch.ones(1, 8, dtype=torch.long)
+        torch.onnx.export(
+            _TextTower(model),
+            (tokens, tokens),
+            text_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["text_embeds"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "text_embeds": {0: "batch"},
+            },
+            opset_version=17,
+        )
+    
+    with open(meta_path, "w") as f:
+        json.dump(
+            {"embed_dim": config.projection_dim, "logit_scale": model.logit_scale.item()},
+            f,
+        )
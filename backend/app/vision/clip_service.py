@@ -2,18 +2,80 @@
 CLIP Vision Service for waste material classification
 """
 import torch
+import torch.nn.functional as F
 import numpy as np
 from PIL import Image
 import io
+import re
+import asyncio
+import contextlib
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
+from torchvision.io import ImageReadMode, decode_jpeg
+from torchvision.transforms import InterpolationMode
+from torchvision.transforms import functional as TF
 from transformers import CLIPProcessor, CLIPModel
+from cachetools import LRUCache
 
 from app.config import settings
+from app.vision.clip_backends import OnnxCLIP, OpenAIJitCLIP
 
 logger = logging.getLogger(__name__)
 
 
+def _keyword_pattern(*keywords: str) -> "re.Pattern":
+    """One alternation matching any keyword as a plain substring"""
+    return re.compile("|".join(map(re.escape, keywords)))
+
+
+# Cleanliness label -> base score (0-100)
+_CLEANLINESS_SCORES = {
+    "very clean recyclable material": 95,
+    "clean recyclable material": 80,
+    "slightly dirty recyclable material": 60,
+    "moderately dirty recyclable material": 40,
+    "very dirty contaminated material": 20,
+}
+
+# Label keyword -> material rules, checked in order (first match wins)
+_MATERIAL_RULES = (
+    # Organic/Bio Waste (check first since it's commonly misclassified)
+    ("Organic/Bio Waste", _keyword_pattern(
+        "fruit", "vegetable", "peel", "food", "kitchen",
+        "organic", "compost", "garden", "leaves", "plant",
+        "apple", "banana", "orange", "citrus", "rotten", "spoiled",
+        "cooked", "leftovers", "scraps"
+    )),
+    
+    # Plastics
+    ("PET", _keyword_pattern("pet")),
+    ("HDPE", _keyword_pattern("hdpe")),
+    ("Plastic", _keyword_pattern("plastic")),
+    
+    # Paper & Cardboard
+    ("Paper", _keyword_pattern("paper", "newspaper")),
+    ("Cardboard", _keyword_pattern("cardboard")),
+    
+    # Glass & Metals
+    ("Glass", _keyword_pattern("glass")),
+    ("Aluminum", _keyword_pattern("aluminum")),
+    ("Steel", _keyword_pattern("steel", "metal")),
+    
+    # Electronics & Batteries
+    ("E-Waste", _keyword_pattern(
+        "electronic", "e-waste", "electrical", "headphone", "earbuds",
+        "phone", "smartphone", "laptop", "computer", "charger",
+        "adapter", "cable", "wire", "circuit", "battery"
+    )),
+    
+    # Textiles
+    ("Textile", _keyword_pattern("textile", "fabric")),
+)
+
+
 class VisionService:
     """CLIP-based vision classification service"""
     
@@ -21,6 +83,43 @@ class VisionService:
         self.model = None
         self.processor = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.dtype = torch.float32
+        
+        # Normalized text features for every label (host float32), filled in by initialize()
+        self._text_feats = None
+        self._logit_scale = 1.0
+        self._label_groups = {}
+        
+        # User queries repeat (RAG seeding, common questions); labels are cached separately
+        self._text_cache = LRUCache(maxsize=1024)
+        
+        # Set from the processor config in initialize()
+        self._image_size = 224
+        self._pixel_mean = None
+        self._pixel_std = None
+        self._pixel_mean_gpu = None
+        self._pixel_std_gpu = None
+        
+        # Micro-batcher: (pixel_values, future) pairs drained by _batch_worker
+        self._queue = None
+        self._batch_task = None
+        self._init_lock = asyncio.Lock()
+        
+        # Every model call (load, warmup, forwards) runs on this one thread: compiled
+        # CUDA graphs are captured into thread-local state and only replay on the
+        # thread that captured them
+        self._model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-model")
+        
+        # Reusable pinned buffer for device->host feature copies (CUDA only)
+        self._host_buf = None
+        self._host_lock = threading.Lock()
+        
+        # Static device input buffer for the image tower (CUDA only, see _load);
+        # only touched on the model thread, where CUDA graphs are captured and replayed
+        self._pixel_buf = None
+        
+        # Dedicated CUDA stream so vision kernels can overlap with Whisper's
+        self._stream = None
         
         # Material categories for zero-shot classification
         self.material_labels = [
@@ -89,81 +188,411 @@ class VisionService:
             "moderately dirty recyclable material",
             "very dirty contaminated material",
         ]
+        
+        # CLIP only ever predicts one of material_labels, so resolve them up front
+        self._label_to_material = {
+            label: self._match_material(label) for label in self.material_labels
+        }
+        
+        # Same for the per-request cleanliness/hazard keyword checks
+        self._cleanliness_phrases = {
+            label: self._cleanliness_phrase(label) for label in self.cleanliness_labels
+        }
+        self._safe_hazard_labels = frozenset(
+            label for label in self.hazard_labels
+            if "safe" in label.lower() or "no hazard" in label.lower()
+        )
     
     async def initialize(self):
-        """Load CLIP model"""
-        try:
-            logger.info(f"Loading CLIP model: {settings.CLIP_MODEL}")
-            
-            self.model = CLIPModel.from_pretrained(settings.CLIP_MODEL)
-            self.processor = CLIPProcessor.from_pretrained(settings.CLIP_MODEL)
-            
-            self.model.to(self.device)
-            self.model.eval()
-            
-            logger.info(f"CLIP model loaded on {self.device}")
-            
-        except Exception as e:
-            logger.error(f"Failed to load CLIP model: {e}")
-            raise
+        """Load CLIP model (idempotent; concurrent callers share a single load)"""
+        async with self._init_lock:
+            if self._batch_task is not None:
+                return
+            
+            try:
+                # Downloads, exports and warmup block for seconds; keep the loop free
+                await self._run_on_model_thread(self._load)
+                
+                self._queue = asyncio.Queue()
+                self._batch_task = asyncio.create_task(self._batch_worker())
+                
+                logger.info(f"CLIP model loaded on {self.device} ({self.dtype})")
+                
+            except Exception as e:
+                logger.error(f"Failed to load CLIP model: {e}")
+                raise
+    
+    def _require_loaded(self):
+        """Fail with a clear error when startup initialization did not succeed"""
+        if self._batch_task is None:
+            raise RuntimeError("CLIP model not loaded")
+    
+    async def close(self):
+        """Stop the batch worker (called from the app's shutdown)"""
+        if self._batch_task is None:
+            return
+        
+        self._batch_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._batch_task
+        self._batch_task = None
+    
+    async def _run_on_model_thread(self, func, *args):
+        """Run func on the dedicated model thread (see _model_executor)"""
+        return await asyncio.get_running_loop().run_in_executor(self._model_executor, func, *args)
+    
+    def _load(self):
+        """Load the configured backend, cache label features and warm up"""
+        if self.device == "cuda":
+            self._stream = torch.cuda.Stream()
+        
+        logger.info(f"Loading CLIP model: {settings.CLIP_MODEL}")
+        
+        self.processor = CLIPProcessor.from_pretrained(settings.CLIP_MODEL)
+        
+        # Pixel normalization constants for the numpy preprocessing path
+        image_processor = self.processor.image_processor
+        self._image_size = image_processor.crop_size["height"]
+        self._pixel_mean = np.array(image_processor.image_mean, dtype=np.float32)
+        self._pixel_std = np.array(image_processor.image_std, dtype=np.float32)
+        if self.device == "cuda":
+            self._pixel_mean_gpu = torch.tensor(image_processor.image_mean, device="cuda").view(3, 1, 1)
+            self._pixel_std_gpu = torch.tensor(image_processor.image_std, device="cuda").view(3, 1, 1)
+        
+        if settings.CLIP_BACKEND == "openai-jit":
+            # TorchScript towers skip the HF per-layer Python dispatch; the
+            # processor above is only kept for its pixel constants
+            self.model = OpenAIJitCLIP(settings.CLIP_JIT_MODEL, self.device)
+            self.dtype = self.model.dtype
+        elif settings.CLIP_BACKEND == "onnx":
+            # Exports the HF towers on first run, then one ONNX Runtime call per forward
+            self.model = OnnxCLIP(settings.CLIP_MODEL, self.device, settings.CLIP_ONNX_DIR)
+            self.dtype = self.model.dtype
+        else:
+            self._load_hf_model()
+        
+        self._cache_label_features()
+        self._text_cache.clear()
+        
+        if self.device == "cuda":
+            # Batches are copied (and cast) into one fixed allocation, so CUDA graphs
+            # see stable input addresses and no per-batch cast tensor is allocated
+            size = self._image_size
+            self._pixel_buf = torch.empty(
+                (settings.CLIP_MAX_BATCH, 3, size, size), device="cuda", dtype=self.dtype
+            )
+        
+        if settings.CLIP_COMPILE and settings.CLIP_BACKEND in ("torch", "int8"):
+            self._warmup()
+    
+    def _load_hf_model(self):
+        """Load the transformers CLIPModel with the configured precision/quantization"""
+        self.model = CLIPModel.from_pretrained(settings.CLIP_MODEL)
+        
+        quantize = settings.CLIP_BACKEND == "int8" and self.device == "cpu"
+        if settings.CLIP_BACKEND == "int8" and not quantize:
+            logger.warning("CLIP int8 backend is CPU-only, running unquantized on GPU")
+        
+        if self.device == "cuda" and settings.CLIP_HALF_PRECISION:
+            self.dtype = torch.float16
+        elif self.device == "cpu" and settings.CLIP_CPU_BF16 and not quantize:
+            self.dtype = torch.bfloat16
+        
+        self.model.to(self.device, dtype=self.dtype)
+        self.model.eval()
+        
+        if settings.CLIP_BACKEND == "autoquant":
+            self._autoquant()
+            return
+        
+        if quantize:
+            # int8 weights + dynamically quantized activations for every Linear
+            # layer; fbgemm uses VNNI int8 dot products where the CPU has them
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        
+        if settings.CLIP_COMPILE:
+            # get_image_features bypasses CLIPModel.forward, so compile the tower itself
+            self.model.vision_model = torch.compile(
+                self.model.vision_model, mode=settings.CLIP_COMPILE_MODE, fullgraph=False
+            )
+    
+    def _autoquant(self):
+        """Quantize the vision tower with torchao (lazily imported, optional dependency)"""
+        from torchao.quantization import autoquant, int8_weight_only, quantize_
+        
+        # autoquant's int8 matmul kernels need SM80+; older GPUs silently fall back
+        # to slower fp paths, so they and CPUs get plain int8 weight-only instead
+        if self.device == "cuda" and torch.cuda.get_device_capability() >= (8, 0):
+            self.model.vision_model = autoquant(
+                torch.compile(self.model.vision_model, mode="max-autotune")
+            )
+            # Calibration pass: autoquant benchmarks each Linear on real shapes
+            size = self._image_size
+            self._forward_images(torch.zeros(1, 3, size, size))
+            if hasattr(self.model.vision_model, "finalize_autoquant"):
+                self.model.vision_model.finalize_autoquant()
+        else:
+            quantize_(self.model, int8_weight_only())
+    
+    def _warmup(self):
+        """Compile (and capture CUDA graphs for) the image tower before the first request"""
+        # A single request and a full batch are the shapes the batcher produces most
+        size = self._image_size
+        for batch in sorted({1, settings.CLIP_MAX_BATCH}):
+            started = time.perf_counter()
+            self._forward_images_to_host(torch.zeros(batch, 3, size, size))
+            logger.info("CLIP warmup for batch %d took %.1fs", batch, time.perf_counter() - started)
+    
+    def _cache_label_features(self):
+        """Encode all classification labels once - they never change"""
+        groups = {
+            "material": self.material_labels,
+            "hazard": self.hazard_labels,
+            "cleanliness": self.cleanliness_labels,
+        }
+        
+        all_labels = []
+        self._label_groups = {}
+        for name, labels in groups.items():
+            self._label_groups[name] = (slice(len(all_labels), len(all_labels) + len(labels)), labels)
+            all_labels.extend(labels)
+        
+        inputs = self._tokenize(all_labels)
+        inputs = {k: self._to_device(v) for k, v in inputs.items()}
+        
+        with torch.inference_mode():
+            text_features = self.model.get_text_features(**inputs)
+            text_features = F.normalize(text_features, dim=-1)
+            self._logit_scale = float(self.model.logit_scale.exp())
+        
+        # Label scoring happens on the host, next to the copied image features.
+        # Copied outside inference_mode so the pinned buffer stays writable later.
+        self._text_feats = self._to_host(text_features)
+    
+    def _tokenize(self, texts: List[str]) -> Dict[str, torch.Tensor]:
+        """Tokenize labels/queries for whichever CLIP backend is loaded"""
+        if isinstance(self.model, OpenAIJitCLIP):
+            return self.model.tokenize(texts)
+        
+        # Truncate to respect CLIP's 77 token limit
+        return self.processor(
+            text=texts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=77
+        )
+    
+    async def _image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Queue one preprocessed image for the batch worker and await its features"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pixel_values, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """Coalesce queued images into one image-tower forward pass"""
+        while True:
+            batch = [await self._queue.get()]
+            
+            # Give concurrent requests a moment to join this batch
+            if self._queue.empty() and settings.CLIP_BATCH_WAIT_MS > 0:
+                await asyncio.sleep(settings.CLIP_BATCH_WAIT_MS / 1000)
+            while len(batch) < settings.CLIP_MAX_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            try:
+                # Items may already be on the GPU (nvJPEG) or still on the host (PIL);
+                # host ones are pinned, so their copies are queued without blocking
+                pixel_values = torch.cat([self._to_device(p) for p, _ in batch])
+                # One pinned device->host copy per batch, synchronized off the event loop
+                features = await self._run_on_model_thread(self._forward_images_to_host, pixel_values)
+            except Exception as e:
+                logger.error("Batched image encoding failed: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for i, (_, future) in enumerate(batch):
+                if not future.done():  # Caller may have been cancelled
+                    future.set_result(features[i:i + 1])
+    
+    def _to_device(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Move a host tensor to the model device via pinned memory and a non_blocking copy"""
+        if self.device != "cuda" or tensor.is_cuda:
+            return tensor
+        # pin_memory() is a no-op for already pinned tensors; the caching host
+        # allocator keeps the staging buffer alive until the copy has run
+        return tensor.pin_memory().to(self.device, non_blocking=True)
+    
+    def _forward_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Normalized image features for a batch of pixel values"""
+        with torch.inference_mode():
+            if self._pixel_buf is not None and pixel_values.shape[0] <= self._pixel_buf.shape[0]:
+                # Forwards only run on the single model thread, so the shared buffer
+                # is never written concurrently and graph replays see its address
+                batch = self._pixel_buf[:pixel_values.shape[0]]
+                batch.copy_(pixel_values, non_blocking=True)
+            else:
+                batch = self._to_device(pixel_values).to(dtype=self.dtype)
+            
+            image_features = self.model.get_image_features(pixel_values=batch)
+            return F.normalize(image_features, dim=-1)
+    
+    def _forward_images_to_host(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """_forward_images with the result already copied to the host"""
+        with self._on_stream():
+            # _to_host synchronizes the vision stream only, not the whole device
+            return self._to_host(self._forward_images(pixel_values))
+    
+    @contextlib.contextmanager
+    def _on_stream(self):
+        """Run the enclosed CUDA work on the vision stream, after work already queued for it"""
+        if self._stream is None:
+            yield
+            return
+        
+        # Inputs were copied/decoded on the caller's stream; order after them
+        self._stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self._stream):
+            yield
+    
+    def _to_host(self, features: torch.Tensor) -> torch.Tensor:
+        """Copy features to CPU float32, through a reusable pinned buffer on CUDA"""
+        if features.device.type != "cuda":
+            return features.float()
+        
+        rows, dim = features.shape
+        with self._host_lock:
+            buf = self._host_buf
+            if buf is None or buf.shape[0] < rows or buf.shape[1] != dim:
+                buf = torch.empty(
+                    (max(rows, settings.CLIP_MAX_BATCH), dim), dtype=torch.float32, pin_memory=True
+                )
+                self._host_buf = buf
+            
+            # Async DMA into page-locked memory (casting on the way), then wait once
+            buf[:rows].copy_(features, non_blocking=True)
+            torch.cuda.current_stream(features.device).synchronize()
+            
+            # The buffer is reused by the next batch, so hand out a private copy
+            return buf[:rows].clone()
+    
+    def _load_image(self, image_bytes: bytes) -> Image.Image:
+        """Decode an upload as RGB, letting libjpeg downscale large JPEGs"""
+        image = Image.open(io.BytesIO(image_bytes))
+        # CLIP only needs 224px; draft() picks the nearest DCT scale (1/2, 1/4, 1/8)
+        # that stays above this size. No-op for non-JPEG formats.
+        image.draft("RGB", (256, 256))
+        return image.convert("RGB")
+    
+    def _preprocess_image(self, image_bytes: bytes) -> torch.Tensor:
+        """
+        Decode and normalize an image into CLIP pixel_values [1, 3, H, W].
+        
+        Same steps as CLIPImageProcessor (bicubic shortest-edge resize, center
+        crop, rescale, normalize) but with vectorized numpy instead of the
+        processor's per-image Python pipeline.
+        """
+        # JPEGs on a GPU host: decode with nvJPEG and ship compressed bytes over PCIe
+        if self._pixel_mean_gpu is not None and settings.CLIP_GPU_DECODE and image_bytes[:2] == b"\xff\xd8":
+            try:
+                return self._preprocess_image_gpu(image_bytes)
+            except RuntimeError as e:
+                logger.debug("nvJPEG decode failed, falling back to PIL: %s", e)
+        
+        image = self._load_image(image_bytes)
+        size = self._image_size
+        
+        width, height = image.size
+        scale = size / min(width, height)
+        image = image.resize(
+            (max(size, round(width * scale)), max(size, round(height * scale))),
+            Image.Resampling.BICUBIC
+        )
+        
+        left = (image.width - size) // 2
+        top = (image.height - size) // 2
+        image = image.crop((left, top, left + size, top + size))
+        
+        pixels = np.asarray(image, dtype=np.float32) * (1.0 / 255.0)
+        pixels = (pixels - self._pixel_mean) / self._pixel_std
+        
+        pixel_values = torch.from_numpy(pixels).permute(2, 0, 1).unsqueeze(0).contiguous()
+        if self.device == "cuda":
+            # Pin here, on the preprocessing thread, so the batcher's H2D copy is async
+            pixel_values = pixel_values.pin_memory()
+        return pixel_values
+    
+    def _preprocess_image_gpu(self, image_bytes: bytes) -> torch.Tensor:
+        """_preprocess_image on the GPU: nvJPEG decode, resize, crop and normalize"""
+        data = torch.frombuffer(bytearray(image_bytes), dtype=torch.uint8)
+        image = decode_jpeg(data, mode=ImageReadMode.RGB, device="cuda")
+        size = self._image_size
+        
+        # Bicubic overshoots, so clamp back to the pixel range like PIL does
+        image = TF.resize(image.float(), size, interpolation=InterpolationMode.BICUBIC, antialias=True)
+        image = TF.center_crop(image.clamp_(0, 255), [size, size])
+        
+        pixels = (image * (1.0 / 255.0) - self._pixel_mean_gpu) / self._pixel_std_gpu
+        return pixels.unsqueeze(0)
     
     async def encode_image(self, image_bytes: bytes) -> np.ndarray:
         """Encode image to embedding vector"""
         try:
-            if self.model is None:
-                await self.initialize()
-            
-            # Load image
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            self._require_loaded()
             
-            # Process image
-            inputs = self.processor(images=image, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            # Load and process image
+            pixel_values = await asyncio.to_thread(self._preprocess_image, image_bytes)
             
-            # Get image embedding
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            # Get image embedding, batched with any concurrent requests
+            image_features = await self._image_features(pixel_values)
             
-            # Convert to numpy
-            embedding = image_features.cpu().numpy()[0]
+            # Already on the host; each request owns its own row
+            embedding = image_features.numpy()[0]
             
             return embedding
             
         except Exception as e:
-            logger.error(f"Failed to encode image: {e}")
+            logger.error("Failed to encode image: %s", e)
             raise
     
     async def encode_text(self, text: str) -> np.ndarray:
         """Encode text to embedding vector"""
         try:
-            if self.model is None:
-                await self.initialize()
-            
-            # Process text with truncation to respect CLIP's 77 token limit
-            inputs = self.processor(
-                text=[text], 
-                return_tensors="pt", 
-                padding=True,
-                truncation=True,
-                max_length=77
-            )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            self._require_loaded()
             
-            # Get text embedding
-            with torch.no_grad():
-                text_features = self.model.get_text_features(**inputs)
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            embedding = self._text_cache.get(text)
+            if embedding is None:
+                # Cache miss: tokenize, forward and the device->host sync all
+                # happen on the model thread instead of stalling the event loop
+                embedding = await self._run_on_model_thread(self._encode_text_sync, text)
+                self._text_cache[text] = embedding
             
-            # Convert to numpy
-            embedding = text_features.cpu().numpy()[0]
-            
-            return embedding
+            # Copy so callers can't mutate the cached embedding
+            return embedding.copy()
             
         except Exception as e:
-            logger.error(f"Failed to encode text: {e}")
+            logger.error("Failed to encode text: %s", e)
             raise
     
+    def _encode_text_sync(self, text: str) -> np.ndarray:
+        """Run the text tower for one string"""
+        inputs = self._tokenize([text])
+        
+        with self._on_stream():
+            inputs = {k: self._to_device(v) for k, v in inputs.items()}
+            
+            # Get text embedding
+            with torch.inference_mode():
+                text_features = self.model.get_text_features(**inputs)
+                text_features = F.normalize(text_features, dim=-1)
+            
+            # Convert to numpy
+            return self._to_host(text_features).numpy()[0]
+    
     async def zero_shot_classification(
         self, 
         image_bytes: bytes
@@ -172,27 +601,30 @@ class VisionService:
         Perform zero-shot classification for material, hazard, and cleanliness
         """
         try:
-            if self.model is None:
-                await self.initialize()
+            self._require_loaded()
             
-            # Load image
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            # Encode the image once and score it against every cached label
+            pixel_values = await asyncio.to_thread(self._preprocess_image, image_bytes)
+            image_features = await self._image_features(pixel_values)
+            
+            # Features arrive on the host; score all three label groups in one matmul
+            logits = self._logit_scale * image_features @ self._text_feats.T
             
             # 1. Material Classification
-            material_result = await self._classify(image, self.material_labels)
+            material_result = self._classify(logits, "material", top_k=3)
             
             # 2. Hazard Detection
-            hazard_result = await self._classify(image, self.hazard_labels)
+            hazard_result = self._classify(logits, "hazard")
             
             # 3. Cleanliness Assessment
-            cleanliness_result = await self._classify(image, self.cleanliness_labels)
+            cleanliness_result = self._classify(logits, "cleanliness")
             
             # Process results
             material = material_result["label"]
             material_confidence = material_result["confidence"]
             
             # Get top 3 predictions for richer context
-            top_predictions = material_result["all_scores"][:3]
+            top_predictions = material_result["top_scores"]
             
             # Map to standard material names
             material_mapped = self._map_material(material)
@@ -206,8 +638,7 @@ class VisionService:
             
             # Hazard class (if not "no hazard" or "safe")
             hazard_class = None
-            hazard_label = hazard_result["label"].lower()
-            if ("safe" not in hazard_label and "no hazard" not in hazard_label 
+            if (hazard_result["label"] not in self._safe_hazard_labels
                 and hazard_result["confidence"] > 0.5):  # Higher threshold to reduce false positives
                 hazard_class = hazard_result["label"]
             
@@ -219,56 +650,41 @@ class VisionService:
                 "confidence": material_confidence,
                 "detailed_description": detailed_description,  # NEW: Rich context for RAG
                 "raw_detection": material,  # What CLIP actually detected
-                "all_predictions": material_result["all_scores"],
+                "all_predictions": top_predictions,
                 "cleanliness_score": cleanliness_score,
                 "hazard_class": hazard_class,
             }
             
         except Exception as e:
-            logger.error(f"Failed to classify image: {e}")
+            logger.error("Failed to classify image: %s", e)
             raise
     
-    async def _classify(
+    def _classify(
         self, 
-        image: Image.Image, 
-        labels: List[str]
+        logits: torch.Tensor, 
+        group: str,
+        top_k: int = 1
     ) -> Dict:
-        """Internal classification method"""
+        """Softmax one label group's slice of the image-text logits, keeping the top_k labels"""
         try:
-            # Process inputs
-            inputs = self.processor(
-                text=labels,
-                images=image,
-                return_tensors="pt",
-                padding=True
-            )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Get predictions
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits_per_image = outputs.logits_per_image
-                probs = logits_per_image.softmax(dim=1)
-            
-            # Get results
-            probs_np = probs.cpu().numpy()[0]
-            top_idx = probs_np.argmax()
-            
-            # All scores
-            all_scores = [
-                {"label": labels[i], "score": float(probs_np[i])}
-                for i in range(len(labels))
+            group_slice, labels = self._label_groups[group]
+            probs = logits[0, group_slice].softmax(dim=0)
+            
+            # Only the top_k entries become Python objects, already sorted by topk
+            top_vals, top_idx = probs.topk(min(top_k, probs.shape[0]))
+            top_scores = [
+                {"label": labels[i], "score": score}
+                for i, score in zip(top_idx.tolist(), top_vals.tolist())
             ]
-            all_scores.sort(key=lambda x: x["score"], reverse=True)
             
             return {
-                "label": labels[top_idx],
-                "confidence": float(probs_np[top_idx]),
-                "all_scores": all_scores
+                "label": top_scores[0]["label"],
+                "confidence": top_scores[0]["score"],
+                "top_scores": top_scores
             }
             
         except Exception as e:
-            logger.error(f"Classification failed: {e}")
+            logger.error("Classification failed: %s", e)
             raise
     
     def _create_detailed_description(
@@ -309,72 +725,39 @@ class VisionService:
         description = "".join(parts) + "."
         
         # Add cleanliness context
-        clean_label = cleanliness_result['label']
-        if "dirty" in clean_label or "contaminated" in clean_label:
-            description += f" The item appears {clean_label.replace('recyclable material', '').strip()}."
-        elif "clean" in clean_label:
-            description += f" The item appears {clean_label.replace('recyclable material', '').strip()}."
+        description += self._cleanliness_phrases[cleanliness_result['label']]
         
         # Add hazard warning if detected (with higher threshold)
-        hazard_label = hazard_result['label'].lower()
-        if ("safe" not in hazard_label and "no hazard" not in hazard_label 
+        if (hazard_result['label'] not in self._safe_hazard_labels
             and hazard_result['confidence'] > 0.5):  # Higher threshold
             description += f" ⚠️ Warning: This may be {hazard_result['label']}."
         
         return description
     
+    def _cleanliness_phrase(self, clean_label: str) -> str:
+        """Description suffix for a cleanliness label (built once per label)"""
+        if "dirty" in clean_label or "contaminated" in clean_label or "clean" in clean_label:
+            return f" The item appears {clean_label.replace('recyclable material', '').strip()}."
+        return ""
+    
     def _map_material(self, predicted_label: str) -> str:
         """Map CLIP label to standard material name"""
+        material = self._label_to_material.get(predicted_label)
+        if material is None:
+            material = self._match_material(predicted_label)
+        return material
+    
+    def _match_material(self, predicted_label: str) -> str:
+        """Keyword match a label to a standard material name"""
         label_lower = predicted_label.lower()
         
-        # Organic/Bio Waste (check first since it's commonly misclassified)
-        if any(keyword in label_lower for keyword in [
-            "fruit", "vegetable", "peel", "food", "kitchen", 
-            "organic", "compost", "garden", "leaves", "plant",
-            "apple", "banana", "orange", "citrus", "rotten", "spoiled",
-            "cooked", "leftovers", "scraps"
-        ]):
-            return "Organic/Bio Waste"
-        
-        # Plastics
-        elif "pet" in label_lower:
-            return "PET"
-        elif "hdpe" in label_lower:
-            return "HDPE"
-        elif "plastic" in label_lower:
-            return "Plastic"
-        
-        # Paper & Cardboard
-        elif "paper" in label_lower or "newspaper" in label_lower:
-            return "Paper"
-        elif "cardboard" in label_lower:
-            return "Cardboard"
-        
-        # Glass & Metals
-        elif "glass" in label_lower:
-            return "Glass"
-        elif "aluminum" in label_lower:
-            return "Aluminum"
-        elif "steel" in label_lower or "metal" in label_lower:
-            return "Steel"
-        
-        # Electronics & Batteries
-        elif any(keyword in label_lower for keyword in [
-            "electronic", "e-waste", "electrical", "headphone", "earbuds",
-            "phone", "smartphone", "laptop", "computer", "charger", 
-            "adapter", "cable", "wire", "circuit"
-        ]):
-            return "E-Waste"
-        elif "battery" in label_lower:
-            return "E-Waste"
-        
-        # Textiles
-        elif "textile" in label_lower or "fabric" in label_lower:
-            return "Textile"
+        # First rule (in priority order) whose keywords occur anywhere in the label
+        for material, pattern in _MATERIAL_RULES:
+            if pattern.search(label_lower):
+                return material
         
         # Default to mixed waste (not plastic)
-        else:
-            return "Mixed Waste"
+        return "Mixed Waste"
     
     def _compute_cleanliness_score(self, cleanliness_result: Dict) -> float:
         """Compute cleanliness score from 0-100"""
@@ -382,15 +765,7 @@ class VisionService:
         confidence = cleanliness_result["confidence"]
         
         # Map labels to scores
-        score_map = {
-            "very clean recyclable material": 95,
-            "clean recyclable material": 80,
-            "slightly dirty recyclable material": 60,
-            "moderately dirty recyclable material": 40,
-            "very dirty contaminated material": 20,
-        }
-        
-        base_score = score_map.get(label, 50)
+        base_score = _CLEANLINESS_SCORES.get(label, 50)
         
         # Adjust by confidence
         final_score = base_score * confidence + 50 * (1 - confidence)
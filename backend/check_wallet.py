@@ -9,21 +9,37 @@ async def check_wallet():
     
     user_id = ObjectId('673fc7f4f1867ab46b0a8c01')
     
+    # One round-trip: the user plus wallet and scan counts joined server-side
+    count_by_user = [{'$match': {'$expr': {'$eq': ['$user_id', '$$uid']}}}, {'$count': 'n'}]
+    pipeline = [
+        {'$match': {'_id': user_id}},
+        {'$lookup': {'from': 'wallets', 'localField': '_id', 'foreignField': 'user_id', 'as': 'wallet'}},
+        {'$lookup': {'from': 'pending_scans', 'let': {'uid': '$_id'}, 'pipeline': count_by_user, 'as': 'pending'}},
+        {'$lookup': {'from': 'completed_scans', 'let': {'uid': '$_id'}, 'pipeline': count_by_user, 'as': 'completed'}},
+    ]
+    result = await db.users.aggregate(pipeline).to_list(length=1)
+    
+    if not result:
+        print('User: None')
+        client.close()
+        return
+    
+    user = result[0]
+    wallet = user.pop('wallet')
+    pending = user.pop('pending')
+    completed = user.pop('completed')
+    
     # Check user
-    user = await db.users.find_one({'_id': user_id})
     print('User:', user)
     
     # Check wallet
-    wallet = await db.wallets.find_one({'user_id': user_id})
-    print('\nWallet:', wallet)
+    print('\nWallet:', wallet[0] if wallet else None)
     
     # Check pending scans
-    pending_count = await db.pending_scans.count_documents({'user_id': user_id})
-    print(f'\nPending scans: {pending_count}')
+    print(f"\nPending scans: {pending[0]['n'] if pending else 0}")
     
     # Check completed scans
-    completed_count = await db.completed_scans.count_documents({'user_id': user_id})
-    print(f'Completed scans: {completed_count}')
+    print(f"Completed scans: {completed[0]['n'] if completed else 0}")
     
     client.close()
 
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Create MongoDB indexes on an existing ReNova database
+Same indexes the backend builds on startup, plus a one-time drop of indexes
+they replaced; run after upgrading a deployment
+"""
+
+import asyncio
+import sys
+import os
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.database import db
+
+# Single-field indexes made redundant by compound indexes with the same prefix
+REDUNDANT_INDEXES = {
+    "pending_items": ("user_id_1", "image_hash_1"),
+    "tokens": ("user_id_1",),
+}
+
+
+async def main():
+    """Connect (which builds all indexes), drop replaced ones and report them"""
+    await db.connect_db()
+    
+    for name, index_names in REDUNDANT_INDEXES.items():
+        existing = await db.db[name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await db.db[name].drop_index(index_name)
+                print(f"🗑️  {name}: dropped {index_name}")
+    
+    for name in ("tokens", "wallets", "pending_items"):
+        indexes = await db.db[name].index_information()
+        print(f"✅ {name}: {', '.join(sorted(indexes))}")
+    
+    await db.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
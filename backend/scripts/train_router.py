@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Train the fast/smart LLM router used by OptimizedLLMService
+Input is JSONL with one {"query": str, "smart": 0|1} object per line, where
+smart=1 marks queries the fast model answered poorly
+"""
+
+import json
+import sys
+import os
+import argparse
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.query_router import route_features
+
+
+def load_examples(path):
+    """Read (features, labels) from a labeled JSONL file"""
+    features, labels = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            features.append(route_features(row["query"].lower()))
+            labels.append(float(row["smart"]))
+    
+    return np.stack(features), np.array(labels, dtype=np.float32)
+
+
+def train(X, y, epochs=500, lr=0.5, l2=1e-3):
+    """Full-batch gradient descent on L2-regularized logistic loss"""
+    weights = np.zeros(X.shape[1], dtype=np.float32)
+    bias = 0.0
+    
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(X @ weights + bias)))
+        error = p - y
+        weights -= lr * (X.T @ error / len(y) + l2 * weights)
+        bias -= lr * float(error.mean())
+    
+    return weights, bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("data", help="Labeled JSONL file")
+    parser.add_argument("--out", default="models/llm_router.npz")
+    parser.add_argument("--epochs", type=int, default=500)
+    args = parser.parse_args()
+    
+    X, y = load_examples(args.data)
+    weights, bias = train(X, y, epochs=args.epochs)
+    
+    accuracy = float((((X @ weights + bias) > 0) == (y > 0.5)).mean())
+    print(f"✅ Trained on {len(y)} queries ({int(y.sum())} smart), train accuracy {accuracy:.1%}")
+    
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    np.savez(args.out, weights=weights, bias=np.float32(bias))
+    print(f"💾 Saved router weights to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
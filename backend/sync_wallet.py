@@ -9,19 +9,26 @@ async def sync_wallet():
     
     user_id = ObjectId('673fc7f4f1867ab46b0a8c01')
     
-    # Get user data
-    user = await db.users.find_one({'_id': user_id})
-    
-    # Update wallet with user's token data
-    await db.wallets.update_one(
-        {'user_id': user_id},
-        {'$set': {
-            'balance': user.get('tokens_balance', 0),
-            'total_earned': user.get('tokens_earned', 0)
+    # Copy the user's token totals onto their wallet server-side in one
+    # round-trip ($merge on user_id relies on the unique wallets.user_id index)
+    pipeline = [
+        {'$match': {'_id': user_id}},
+        {'$project': {
+            '_id': 0,
+            'user_id': '$_id',
+            'balance': {'$ifNull': ['$tokens_balance', 0]},
+            'total_earned': {'$ifNull': ['$tokens_earned', 0]}
+        }},
+        {'$merge': {
+            'into': 'wallets',
+            'on': 'user_id',
+            'whenMatched': 'merge',
+            'whenNotMatched': 'discard'
         }}
-    )
+    ]
+    await db.users.aggregate(pipeline).to_list(length=None)
     
-    print(f"Synced wallet: balance={user.get('tokens_balance', 0)}, earned={user.get('tokens_earned', 0)}")
+    print(f"Synced wallet for user {user_id}")
     
     client.close()
 